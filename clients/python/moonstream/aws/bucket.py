@@ -1,17 +1,24 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Union
 
 import boto3
 
 
 def upload_to_aws_s3_bucket(
-    data: str,
+    data: Union[str, bytes],
     bucket: str,
     key: str,
     metadata: Dict[str, Any] = {},
+    cache_control: Optional[str] = None,
 ) -> str:
     """
     Push data to AWS S3 bucket and return URL to object.
+
+    cache_control is set as Cache-Control header of the object if provided.
     """
+    extra_args: Dict[str, Any] = {}
+    if cache_control is not None:
+        extra_args["CacheControl"] = cache_control
+
     s3 = boto3.client("s3")
     s3.put_object(
         Body=data,
@@ -19,6 +26,7 @@ def upload_to_aws_s3_bucket(
         Key=key,
         ContentType="application/json",
         Metadata=metadata,
+        **extra_args,
     )
 
     return f"{bucket}/{key}"
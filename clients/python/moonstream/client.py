@@ -1,5 +1,5 @@
 import uuid
-from typing import Any, Dict, Union
+from typing import Any, Dict, Optional, Union
 
 import requests
 
@@ -187,6 +187,30 @@ class Moonstream:
 
         return MoonstreamQueryResultUrl(url=response["url"])
 
+    def get_query_result_url(
+        self,
+        token: Union[str, uuid.UUID],
+        name: str,
+        auth_type: AuthType = AuthType.bearer,
+        timeout: float = MOONSTREAM_REQUEST_TIMEOUT,
+    ) -> MoonstreamQueryResultUrl:
+        """
+        Returns url to results of query in external storage, without executing the query.
+        """
+        headers = {
+            "Authorization": f"{auth_type.value} {token}",
+        }
+        response = self._call(
+            method=Method.GET,
+            url=f"{self.api.endpoints[ENDPOINT_QUERIES]}/{name}",
+            headers=headers,
+            timeout=timeout,
+        )
+        if response is None:
+            raise MoonstreamUnexpectedResponse(f"Query {name} is not approved yet")
+
+        return MoonstreamQueryResultUrl(url=response["url"])
+
     def download_query_results(
         self,
         url: str,
@@ -212,7 +236,12 @@ class Moonstream:
         return output
 
     def upload_query_results(
-        self, data: str, bucket: str, key: str, metadata: Dict[str, Any] = {}
+        self,
+        data: Union[str, bytes],
+        bucket: str,
+        key: str,
+        metadata: Dict[str, Any] = {},
+        cache_control: Optional[str] = None,
     ) -> str:
         """
         Uploads data to AWS S3 bucket.
@@ -221,7 +250,11 @@ class Moonstream:
         """
         try:
             url = upload_to_aws_s3_bucket(
-                data=data, bucket=bucket, key=key, metadata=metadata
+                data=data,
+                bucket=bucket,
+                key=key,
+                metadata=metadata,
+                cache_control=cache_control,
             )
         except Exception as e:
             raise Exception(str(e))
@@ -1,5 +1,7 @@
 import os
+import sys
 import unittest
+from unittest import mock
 
 from . import client
 
@@ -52,3 +54,58 @@ class TestMoonstreamCalls(unittest.TestCase):
         for query in queries.queries:
             if query.name.startswith("test_query_name"):
                 self.m.delete_query(self.token, query.name)
+
+
+class TestUploadQueryResults(unittest.TestCase):
+    def setUp(self):
+        # boto3 is an optional dependency ("aws" extra)
+        with mock.patch.dict(
+            sys.modules, {"boto3": sys.modules.get("boto3", mock.MagicMock())}
+        ):
+            from .aws import bucket
+
+        self.bucket = bucket
+
+    def test_cache_control_is_forwarded(self):
+        with mock.patch.object(self.bucket, "boto3") as boto3:
+            self.bucket.upload_to_aws_s3_bucket(
+                data=b"{}", bucket="bucket", key="key", cache_control="max-age=3600"
+            )
+            put_object = boto3.client.return_value.put_object
+            self.assertEqual(
+                put_object.call_args.kwargs["CacheControl"], "max-age=3600"
+            )
+
+    def test_cache_control_is_not_set_by_default(self):
+        with mock.patch.object(self.bucket, "boto3") as boto3:
+            self.bucket.upload_to_aws_s3_bucket(data="{}", bucket="bucket", key="key")
+            put_object = boto3.client.return_value.put_object
+            self.assertNotIn("CacheControl", put_object.call_args.kwargs)
+
+    def test_client_forwards_cache_control(self):
+        m = client.Moonstream()
+        with mock.patch.object(
+            client, "upload_to_aws_s3_bucket", create=True
+        ) as upload_to_aws_s3_bucket:
+            m.upload_query_results(b"{}", "bucket", "key", cache_control="max-age=60")
+            self.assertEqual(
+                upload_to_aws_s3_bucket.call_args.kwargs["cache_control"], "max-age=60"
+            )
+
+
+class TestGetQueryResultUrl(unittest.TestCase):
+    def test_query_is_not_executed(self):
+        m = client.Moonstream(moonstream_api_url="https://api.moonstream.to")
+        with mock.patch.object(m, "_call", return_value={"url": "https://s3"}) as call:
+            result = m.get_query_result_url("token", "query")
+            self.assertEqual(result.url, "https://s3")
+            self.assertEqual(call.call_args.kwargs["method"], client.Method.GET)
+            self.assertEqual(
+                call.call_args.kwargs["url"], "https://api.moonstream.to/queries/query"
+            )
+
+    def test_not_approved_query_raises(self):
+        m = client.Moonstream()
+        with mock.patch.object(m, "_call", return_value=None):
+            with self.assertRaises(client.MoonstreamUnexpectedResponse):
+                m.get_query_result_url("token", "query")
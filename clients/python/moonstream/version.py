@@ -1 +1 @@
-MOONSTREAM_CLIENT_VERSION = "0.1.1"
+MOONSTREAM_CLIENT_VERSION = "0.1.2"
@@ -91,7 +91,7 @@ echo -e "${PREFIX_INFO} Upgrading Python pip and setuptools"
 echo
 echo
 echo -e "${PREFIX_INFO} Installing Python dependencies"
-"${PIP}" install -e "${APP_CRAWLERS_DIR}/mooncrawl/"
+"${PIP}" install -e "${APP_CRAWLERS_DIR}/mooncrawl/[reports]"
 
 echo
 echo
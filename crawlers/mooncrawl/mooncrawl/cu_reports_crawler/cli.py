@@ -1,15 +1,27 @@
 import argparse
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
 import datetime
 import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+import random
 from moonstream.client import Moonstream  # type: ignore
 import time
 import requests
-import json
+from requests.adapters import HTTPAdapter
 
-from typing import Any, Dict, Union
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 
 from uuid import UUID
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore
+
 from .queries import tokenomics_queries, cu_bank_queries
 
 from ..settings import (
@@ -21,6 +33,9 @@ from ..settings import (
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+TOKENOMICS_BY_NAME = {query["name"]: query for query in tokenomics_queries}
+CU_BANK_BY_NAME = {query["name"]: query for query in cu_bank_queries}
+
 addresess_erc20_721 = {
     "0x64060aB139Feaae7f06Ca4E63189D86aDEb51691": "ERC20",  # UNIM
     "0x431CD3C9AC9Fc73644BF68bF5691f4B83F9E104f": "ERC20",  # RBW
@@ -31,56 +46,392 @@ addresess_erc20_721 = {
 
 addresess_erc1155 = ["0x99A558BDBdE247C2B2716f0D4cFb0E246DFB697D"]
 
+ADDRESS_TYPES = {
+    **addresess_erc20_721,
+    **{address: "ERC1155" for address in addresess_erc1155},
+}
+
+ERC20_721_ADDRESSES = tuple(addresess_erc20_721)
+NFT_ADDRESSES = tuple(
+    address for address, type in addresess_erc20_721.items() if type == "NFT"
+)
+ERC1155_ADDRESSES = tuple(addresess_erc1155)
+
+# slug is time_range as used in S3 keys
+ranges: List[Dict[str, Any]] = [
+    {"time_format": "YYYY-MM-DD HH24", "time_range": "24 hours", "slug": "24_hours"},
+    {"time_format": "YYYY-MM-DD HH24", "time_range": "7 days", "slug": "7_days"},
+    {"time_format": "YYYY-MM-DD", "time_range": "30 days", "slug": "30_days"},
+]
+
+
+@dataclass
+class ReportSpec:
+    """
+    Tokenomics query and how to build params and S3 key of its report for every address
+    and variant (time range, amount, ...).
+
+    params and key are called with (address, type, variant), key returns the path
+    between query name and data.json.
+    """
+
+    query_name: str
+    addresses: Tuple[str, ...]
+    params: Callable[[str, str, Dict[str, Any]], Dict[str, Any]]
+    key: Callable[[str, str, Dict[str, Any]], str]
+    variants: List[Dict[str, Any]] = field(default_factory=lambda: [{}])
+
+    def iter(self) -> Iterator[Tuple[str, str, Dict[str, Any]]]:
+        for address in self.addresses:
+            for variant in self.variants:
+                yield address, ADDRESS_TYPES[address], variant
+
+
+def range_key(address: str, type: str, range: Dict[str, Any]) -> str:
+    return f'{address}/{range["slug"]}'
+
+
+def address_key(address: str, type: str, variant: Dict[str, Any]) -> str:
+    return address
+
+
+def address_params(address: str, type: str, variant: Dict[str, Any]) -> Dict[str, Any]:
+    return {"address": address}
+
+
+REPORTS = [
+    # volume of erc20 and erc721
+    ReportSpec(
+        query_name="erc20_721_volume",
+        addresses=ERC20_721_ADDRESSES,
+        variants=ranges,
+        params=lambda address, type, range: {
+            "address": address,
+            "type": type,
+            "time_format": range["time_format"],
+            "time_range": range["time_range"],
+        },
+        key=range_key,
+    ),
+    # volume change of erc20 and erc721
+    ReportSpec(
+        query_name="volume_change",
+        addresses=ERC20_721_ADDRESSES,
+        variants=ranges,
+        params=lambda address, type, range: {
+            "address": address,
+            "type": type,
+            "time_range": range["time_range"],
+        },
+        key=range_key,
+    ),
+    # volume of erc1155
+    ReportSpec(
+        query_name="erc1155_volume",
+        addresses=ERC1155_ADDRESSES,
+        variants=ranges,
+        params=lambda address, type, range: {
+            "address": address,
+            "time_format": range["time_format"],
+            "time_range": range["time_range"],
+        },
+        key=range_key,
+    ),
+    ReportSpec(
+        query_name="most_recent_sale",
+        addresses=NFT_ADDRESSES,
+        variants=[{"amount": 10}, {"amount": 100}],
+        params=lambda address, type, variant: {
+            "address": address,
+            "amount": variant["amount"],
+        },
+        key=lambda address, type, variant: f'{address}/{variant["amount"]}',
+    ),
+    ReportSpec(
+        query_name="most_active_buyers",
+        addresses=NFT_ADDRESSES,
+        variants=ranges,
+        params=lambda address, type, range: {
+            "address": address,
+            "time_range": range["time_range"],
+        },
+        key=range_key,
+    ),
+    ReportSpec(
+        query_name="most_active_sellers",
+        addresses=NFT_ADDRESSES,
+        variants=ranges,
+        params=lambda address, type, range: {
+            "address": address,
+            "time_range": range["time_range"],
+        },
+        key=range_key,
+    ),
+    ReportSpec(
+        query_name="lagerst_owners",
+        addresses=NFT_ADDRESSES,
+        params=address_params,
+        key=address_key,
+    ),
+    ReportSpec(
+        query_name="total_supply_erc721",
+        addresses=NFT_ADDRESSES,
+        params=address_params,
+        key=address_key,
+    ),
+    ReportSpec(
+        query_name="total_supply_terminus",
+        addresses=ERC1155_ADDRESSES,
+        params=address_params,
+        key=address_key,
+    ),
+]
+
+# Reports are regenerated every hour (deploy/polygon-cu-reports-tokenonomics.timer).
+# max-age counts from the time a copy is fetched, so a copy fetched just before a run
+# may still be served for up to an hour after the reports are regenerated.
+REPORT_CACHE_CONTROL = "max-age=3600"
+
+# (params, key) of report
+Report = Tuple[Dict[str, Any], str]
+
+
+_client: Optional[Moonstream] = None
+
+
+def get_client() -> Moonstream:
+    """
+    Return Moonstream client shared by all handlers.
+    """
+
+    global _client
+    if _client is None:
+        _client = Moonstream()
+    return _client
+
+
+# Shared between report workers to reuse keep-alive connections to S3
+s3_session = requests.Session()
+s3_session.mount(
+    "https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0)
+)
+
+
+def poll_delay(repeat: int, backoff_base: float, backoff_cap: float) -> float:
+    """
+    Exponential backoff delay with jitter before poll number repeat.
+    """
+
+    delay = min(backoff_cap, backoff_base * (1 << repeat))
+    return delay + random.uniform(0, 0.1 * delay)
+
+
+@dataclass
+class QueryResultsPoll:
+    """
+    State of polling S3 for results of a query run, shared by sync and asyncio pollers.
+
+    Changes are detected with ETag: etag holds the ETag of results on S3 before execution,
+    see on_previous_response, and polling continues with If-None-Match until the object changes.
+    Results of all runs of a query share one S3 key, so results of a previous run belong to
+    other params and are never returned, an exception is raised if the object does not change.
+
+    Polls with exponential backoff (with jitter) starting at backoff_base seconds and capped at backoff_cap seconds,
+    for at most max_retries requests (including requests for previous results) and max_wait
+    seconds after execution in total.
+    """
+
+    query_name: str
+    backoff_base: float = 0.2
+    backoff_cap: float = 8.0
+    max_retries: int = 30
+    max_wait: float = 64
+    executed_at: float = field(default_factory=time.time)
+    repeat: int = 0
+    etag: Optional[str] = None
+
+    def delay(self) -> float:
+        """
+        Seconds to wait before the next poll, never past the deadline.
+        """
+
+        return min(
+            poll_delay(self.repeat, self.backoff_base, self.backoff_cap),
+            max(0, self.executed_at + self.max_wait - time.time()),
+        )
+
+    def exhausted(self) -> bool:
+        return (
+            self.repeat > self.max_retries
+            or time.time() >= self.executed_at + self.max_wait
+        )
+
+    def on_error(self) -> bool:
+        """
+        Count failed poll, return True if the error should be raised.
+        """
+
+        self.repeat += 1
+        return self.exhausted()
+
+    def on_previous_error(self, reason: str) -> bool:
+        """
+        Count failed request for previous results, return True if they should not be requested again.
+
+        If previous results can not be read, polling continues without ETag and the first
+        results found are returned.
+        """
+
+        self.repeat += 1
+        if self.exhausted():
+            logger.warning(
+                f"Can not read previous results of query: {self.query_name} ({reason}), new results are not checked"
+            )
+            return True
+        return False
+
+    def on_previous_response(self, status: int, etag: Optional[str]) -> bool:
+        """
+        Record ETag of results on S3 from response to a request made before the query is executed.
+
+        Return True if the ETag is known or there are no results yet, otherwise request again.
+        """
+
+        if status in (200, 206):
+            if etag is None:
+                logger.warning(
+                    f"Previous results of query: {self.query_name} have no ETag, new results are not checked"
+                )
+            self.etag = etag
+            return True
+        # Without s3:ListBucket permission S3 responds 403 instead of 404 for missing objects
+        if status in (403, 404):
+            return True
+        return self.on_previous_error(f"status code: {status}")
+
+    def on_executed(self) -> None:
+        self.executed_at = time.time()
+
+    def headers(self) -> Dict[str, str]:
+        return {"If-None-Match": self.etag} if self.etag is not None else {}
+
+    def on_response(self, status: int) -> bool:
+        """
+        Return True if response holds results of this run, otherwise poll again.
+        """
+
+        # With If-None-Match unchanged results of previous run are 304
+        if status == 200:
+            return True
+
+        self.repeat += 1
+
+        if self.exhausted():
+            logger.info("Too many retries")
+            if status == 304:
+                raise Exception(f"Results of query: {self.query_name} not changed")
+            raise Exception(
+                f"Results of query: {self.query_name} not available, last status code: {status}"
+            )
+
+        return False
+
 
 def recive_S3_data_from_query(
     client: Moonstream,
     token: Union[str, UUID],
     query_name: str,
     params: Dict[str, Any],
-    time_await: int = 2,
-    max_retries: int = 30,
-) -> Any:
-
-    """
-    Await the query to be update data on S3 with if_modified_since and return new the data.
+    results_url: str,
+    **poll_kwargs: Any,
+) -> bytes:
     """
+    Await the query to be update data on S3 and return new the data as raw bytes.
 
-    keep_going = True
-
-    repeat = 0
+    results_url is a presigned url of the query results (Moonstream.get_query_result_url),
+    results there are read before execution to tell them from results of this run.
+    poll_kwargs are passed to QueryResultsPoll.
+    """
 
-    if_modified_since_datetime = datetime.datetime.utcnow()
-    if_modified_since = if_modified_since_datetime.strftime("%a, %d %b %Y %H:%M:%S GMT")
+    poll = QueryResultsPoll(query_name=query_name, **poll_kwargs)
 
-    time.sleep(2)
+    while True:
+        try:
+            # Only the ETag is needed, do not download previous results
+            previous_response = s3_session.get(
+                results_url, headers={"Range": "bytes=0-0"}, timeout=5
+            )
+        except Exception as e:
+            logger.error(e)
+            if poll.on_previous_error(str(e)):
+                break
+        else:
+            if poll.on_previous_response(
+                previous_response.status_code, previous_response.headers.get("ETag")
+            ):
+                break
+        time.sleep(poll.delay())
 
     data_url = client.exec_query(
         token=token,
         name=query_name,
         params=params,
     )  # S3 presign_url
+    poll.on_executed()
 
-    while keep_going:
-        time.sleep(time_await)
+    while True:
+        time.sleep(poll.delay())
         try:
-            data_response = requests.get(
+            data_response = s3_session.get(
                 data_url.url,
-                headers={"If-Modified-Since": if_modified_since},
+                headers=poll.headers(),
                 timeout=5,
             )
         except Exception as e:
             logger.error(e)
+            if poll.on_error():
+                raise
             continue
 
-        if data_response.status_code == 200:
-            break
+        if poll.on_response(data_response.status_code):
+            return data_response.content
 
-        repeat += 1
 
-        if repeat > max_retries:
-            logger.info("Too many retries")
-            break
-    return data_response.json()
+@contextmanager
+def report_errors(query_name: str, bucket: str, key: str) -> Iterator[None]:
+    """
+    Log errors of report generation instead of raising them, so one failed report
+    does not stop the other reports.
+    """
+
+    try:
+        yield
+    except Exception as err:
+        logger.error(
+            f"Cant recive or load data for s3, for query: {query_name}, bucket: {bucket}, key: {key}. End with error: {err}"
+        )
+
+
+def upload_report(
+    client: Moonstream,
+    data: bytes,
+    bucket_prefix: str,
+    bucket: str,
+    key: str,
+):
+    """
+    Upload the report to the public bucket.
+    """
+
+    client.upload_query_results(
+        data,
+        bucket,
+        f"{bucket_prefix}/{key}",
+        cache_control=REPORT_CACHE_CONTROL,
+    )
+    logger.info(
+        f"Report generated and results uploaded at: https://{bucket}/{bucket_prefix}/{key}"
+    )
 
 
 def generate_report(
@@ -88,6 +439,7 @@ def generate_report(
     token: Union[str, UUID],
     query_name: str,
     params: Dict[str, Any],
+    results_url: str,
     bucket_prefix: str,
     bucket: str,
     key: str,
@@ -96,346 +448,381 @@ def generate_report(
     Generate the report.
     """
 
-    try:
-
-        json_data = recive_S3_data_from_query(
+    with report_errors(query_name=query_name, bucket=bucket, key=key):
+        data = recive_S3_data_from_query(
             client=client,
             token=token,
             query_name=query_name,
             params=params,
+            results_url=results_url,
         )
 
-        client.upload_query_results(
-            json.dumps(json_data),
-            bucket,
-            f"{bucket_prefix}/{key}",
-        )
-        logger.info(
-            f"Report generated and results uploaded at: https://{bucket}/{bucket_prefix}/{key}"
-        )
-    except Exception as err:
-        logger.error(
-            f"Cant recive or load data for s3, for query: {query_name}, bucket: {bucket}, key: {key}. End with error: {err}"
+        upload_report(
+            client=client,
+            data=data,
+            bucket_prefix=bucket_prefix,
+            bucket=bucket,
+            key=key,
         )
 
 
-def create_user_query(
+def generate_query_reports(
     client: Moonstream,
     token: Union[str, UUID],
     query_name: str,
-    query: str,
+    reports: List[Report],
+    bucket_prefix: str,
+    bucket: str,
 ):
     """
-    Create a user query.
+    Generate reports of one query one after another.
+
+    Query results are stored on S3 under a single key per query, so runs of the same query
+    with different params must not overlap.
     """
 
-    try:
-        client.create_query(token=token, name=query_name, query=query)
-    except Exception as err:
-        logger.error(f"Cant create user query: {query_name}. End with error: {err}")
+    results_url = client.get_query_result_url(token=token, name=query_name).url
+
+    for params, key in reports:
+        generate_report(
+            client=client,
+            token=token,
+            query_name=query_name,
+            params=params,
+            results_url=results_url,
+            bucket_prefix=bucket_prefix,
+            bucket=bucket,
+            key=key,
+        )
 
 
-def delete_user_query(client: Moonstream, token: str, query_name: str):
+async def recive_S3_data_from_query_async(
+    session: "aiohttp.ClientSession",
+    client: Moonstream,
+    token: Union[str, UUID],
+    query_name: str,
+    params: Dict[str, Any],
+    results_url: str,
+    **poll_kwargs: Any,
+) -> bytes:
     """
-    Delete the user's queries.
+    Asyncio version of recive_S3_data_from_query, polls S3 with aiohttp session.
     """
 
-    id = client.delete_query(
-        token=token,
-        name=query_name,
-    )
-
-    logger.info(f"Query with name:{query_name} and id: {id} was deleted")
-
+    loop = asyncio.get_running_loop()
 
-def init_game_bank_queries_handler(args: argparse.Namespace):
+    # Same as requests timeout: limit connect and each read, not whole body download
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=5)
 
-    """
-    Create the game bank queries.
-    """
+    poll = QueryResultsPoll(query_name=query_name, **poll_kwargs)
 
-    client = Moonstream()
+    while True:
+        try:
+            # Only the ETag is needed, do not download previous results
+            async with session.get(
+                results_url, headers={"Range": "bytes=0-0"}, timeout=timeout
+            ) as previous_response:
+                status = previous_response.status
+                previous_etag = previous_response.headers.get("ETag")
+        except Exception as e:
+            logger.error(e)
+            if poll.on_previous_error(str(e)):
+                break
+        else:
+            if poll.on_previous_response(status, previous_etag):
+                break
+        await asyncio.sleep(poll.delay())
 
-    for query in cu_bank_queries:
+    data_url = await loop.run_in_executor(
+        None,
+        lambda: client.exec_query(token=token, name=query_name, params=params),
+    )  # S3 presign_url
+    poll.on_executed()
 
+    while True:
+        await asyncio.sleep(poll.delay())
         try:
-            if args.overwrite:
-                try:
-                    # delete
-                    delete_user_query(
-                        client=client,
-                        token=args.moonstream_token,
-                        query_name=query["name"],
-                    )
-                except Exception as err:
-                    logger.error(err)
-            # create
-            created_entry = client.create_query(
-                token=args.moonstream_token,
-                name=query["name"],
-                query=query["query"],
-            )
-            logger.info(
-                f"Created query {query['name']} please validate it in the UI url {created_entry.journal_url}/entries/{created_entry.id}/"
-            )
+            async with session.get(
+                data_url.url,
+                headers=poll.headers(),
+                timeout=timeout,
+            ) as data_response:
+                status = data_response.status
+                data = await data_response.read()
         except Exception as e:
             logger.error(e)
-            pass
+            if poll.on_error():
+                raise
+            continue
 
+        if poll.on_response(status):
+            return data
 
-def init_tokenomics_queries_handler(args: argparse.Namespace):
 
+async def generate_query_reports_async(
+    session: "aiohttp.ClientSession",
+    semaphore: asyncio.Semaphore,
+    client: Moonstream,
+    token: Union[str, UUID],
+    query_name: str,
+    reports: List[Report],
+    bucket_prefix: str,
+    bucket: str,
+):
     """
-    Create the tokenomics queries.
+    Asyncio version of generate_query_reports.
     """
 
-    client = Moonstream()
+    loop = asyncio.get_running_loop()
 
-    for query in tokenomics_queries:
+    async with semaphore:
+        results_url = (
+            await loop.run_in_executor(
+                None,
+                lambda: client.get_query_result_url(token=token, name=query_name),
+            )
+        ).url
 
-        try:
-            if args.overwrite:
-                try:
-                    # delete
-                    delete_user_query(
+        for params, key in reports:
+            with report_errors(query_name=query_name, bucket=bucket, key=key):
+                data = await recive_S3_data_from_query_async(
+                    session=session,
+                    client=client,
+                    token=token,
+                    query_name=query_name,
+                    params=params,
+                    results_url=results_url,
+                )
+
+                await loop.run_in_executor(
+                    None,
+                    lambda: upload_report(
                         client=client,
-                        token=args.moonstream_token,
-                        query_name=query["name"],
-                    )
-                except Exception as err:
-                    logger.error(err)
-            # create
-            created_entry = client.create_query(
-                token=args.moonstream_token,
-                name=query["name"],
-                query=query["query"],
-            )
-            logger.info(
-                f"Created query {query['name']} please validate it in the UI url {created_entry.journal_url}/entries/{created_entry.id}/"
-            )
-        except Exception as e:
-            logger.error(e)
-            pass
+                        data=data,
+                        bucket_prefix=bucket_prefix,
+                        bucket=bucket,
+                        key=key,
+                    ),
+                )
 
 
-def run_tokenomics_queries_handler(args: argparse.Namespace):
+async def generate_reports_async(
+    client: Moonstream,
+    token: Union[str, UUID],
+    reports_by_query: Dict[str, List[Report]],
+    bucket_prefix: str,
+    bucket: str,
+    max_workers: int,
+):
+    """
+    Generate reports of all queries concurrently in one event loop.
+    """
 
-    client = Moonstream()
+    semaphore = asyncio.Semaphore(max_workers)
 
-    query_name = "erc20_721_volume"
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(
+            *[
+                generate_query_reports_async(
+                    session=session,
+                    semaphore=semaphore,
+                    client=client,
+                    token=token,
+                    query_name=query_name,
+                    reports=query_reports,
+                    bucket_prefix=bucket_prefix,
+                    bucket=bucket,
+                )
+                for query_name, query_reports in reports_by_query.items()
+            ],
+            return_exceptions=True,
+        )
 
-    ### Run voluem query
+    for query_name, result in zip(reports_by_query, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Reports of query {query_name} failed with error: {result}")
 
-    ranges = [
-        {"time_format": "YYYY-MM-DD HH24", "time_range": "24 hours"},
-        {"time_format": "YYYY-MM-DD HH24", "time_range": "7 days"},
-        {"time_format": "YYYY-MM-DD", "time_range": "30 days"},
-    ]
 
-    # volume of erc20 and erc721
+def create_user_query(
+    client: Moonstream,
+    token: Union[str, UUID],
+    query_name: str,
+    query: str,
+):
+    """
+    Create a user query.
+    """
 
-    for address, type in addresess_erc20_721.items():
-        for range in ranges:
+    try:
+        client.create_query(token=token, name=query_name, query=query)
+    except Exception as err:
+        logger.error(f"Cant create user query: {query_name}. End with error: {err}")
 
-            params: Dict[str, Any] = {
-                "address": address,
-                "type": type,
-                "time_format": range["time_format"],
-                "time_range": range["time_range"],
-            }
 
-            generate_report(
-                client=client,
-                token=args.moonstream_token,
-                query_name=query_name,
-                params=params,
-                bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                key=f'{query_name}/{address}/{range["time_range"].replace(" ","_")}/data.json',
-            )
+def delete_user_query(client: Moonstream, token: Union[str, UUID], query_name: str):
+    """
+    Delete the user's queries.
+    """
 
-    # volume change of erc20 and erc721
+    id = client.delete_query(
+        token=token,
+        name=query_name,
+    )
 
-    query_name = "volume_change"
+    logger.info(f"Query with name:{query_name} and id: {id} was deleted")
 
-    for address, type in addresess_erc20_721.items():
-        for range in ranges:
 
-            params = {
-                "address": address,
-                "type": type,
-                "time_range": range["time_range"],
-            }
+def init_query(
+    client: Moonstream,
+    token: Union[str, UUID],
+    query: Dict[str, str],
+    overwrite: bool = False,
+):
+    """
+    Create the query, delete existing one before if overwrite is set.
+    """
 
-            generate_report(
+    if overwrite:
+        try:
+            # delete
+            delete_user_query(
                 client=client,
-                token=args.moonstream_token,
-                query_name=query_name,
-                params=params,
-                bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                key=f'{query_name}/{address}/{range["time_range"].replace(" ","_")}/data.json',
+                token=token,
+                query_name=query["name"],
             )
+        except Exception as err:
+            logger.error(err)
+    # create
+    created_entry = client.create_query(
+        token=token,
+        name=query["name"],
+        query=query["query"],
+    )
+    logger.info(
+        f"Created query {query['name']} please validate it in the UI url {created_entry.journal_url}/entries/{created_entry.id}/"
+    )
 
-    query_name = "erc1155_volume"
-
-    # volume of erc1155
-
-    addresess_erc1155 = ["0x99A558BDBdE247C2B2716f0D4cFb0E246DFB697D"]
 
-    for address in addresess_erc1155:
-        for range in ranges:
+def init_queries(
+    client: Moonstream,
+    token: Union[str, UUID],
+    queries: List[Dict[str, str]],
+    overwrite: bool = False,
+    max_workers: int = 16,
+):
+    """
+    Create the queries concurrently.
 
-            params = {
-                "address": address,
-                "time_format": range["time_format"],
-                "time_range": range["time_range"],
-            }
+    Moonstream API has no bulk create endpoint, so each query costs its own delete and create requests.
+    """
 
-            generate_report(
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures: Dict[Future, str] = {
+            executor.submit(
+                init_query,
                 client=client,
-                token=args.moonstream_token,
-                query_name=query_name,
-                params=params,
-                bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                key=f"{query_name}/{address}/{range['time_range'].replace(' ','_')}/data.json",
-            )
-
-    # most_recent_sale
-
-    query_name = "most_recent_sale"
-
-    for address, type in addresess_erc20_721.items():
-        if type == "NFT":
-            for amount in [10, 100]:
-                params = {
-                    "address": address,
-                    "amount": amount,
-                }
+                token=token,
+                query=query,
+                overwrite=overwrite,
+            ): query["name"]
+            for query in queries
+        }
 
-                generate_report(
-                    client=client,
-                    token=args.moonstream_token,
-                    query_name=query_name,
-                    params=params,
-                    bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                    bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                    key=f"{query_name}/{address}/{amount}/data.json",
+        for future in as_completed(futures):
+            error = future.exception()
+            if error is not None:
+                logger.error(
+                    f"Cant create query: {futures[future]}. End with error: {error}"
                 )
 
-    # most_active_buyers
-
-    query_name = "most_active_buyers"
-
-    for address, type in addresess_erc20_721.items():
-
-        if type == "NFT":
-
-            for range in ranges:
-
-                params = {
-                    "address": address,
-                    "time_range": range["time_range"],
-                }
 
-                generate_report(
-                    client=client,
-                    token=args.moonstream_token,
-                    query_name=query_name,
-                    params=params,
-                    bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                    bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                    key=f"{query_name}/{address}/{range['time_range'].replace(' ','_')}/data.json",
-                )
+def init_game_bank_queries_handler(args: argparse.Namespace):
 
-    # most_active_sellers
+    """
+    Create the game bank queries.
+    """
 
-    query_name = "most_active_sellers"
+    client = get_client()
 
-    for address, type in addresess_erc20_721.items():
+    init_queries(
+        client=client,
+        token=args.moonstream_token,
+        queries=list(CU_BANK_BY_NAME.values()),
+        overwrite=args.overwrite,
+        max_workers=args.max_workers,
+    )
 
-        if type == "NFT":
 
-            for range in ranges:
+def init_tokenomics_queries_handler(args: argparse.Namespace):
 
-                params = {
-                    "address": address,
-                    "time_range": range["time_range"],
-                }
+    """
+    Create the tokenomics queries.
+    """
 
-                generate_report(
-                    client=client,
-                    token=args.moonstream_token,
-                    query_name=query_name,
-                    params=params,
-                    bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                    bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                    key=f"{query_name}/{address}/{range['time_range'].replace(' ','_')}/data.json",
-                )
+    client = get_client()
 
-    # lagerst_owners
+    init_queries(
+        client=client,
+        token=args.moonstream_token,
+        queries=list(TOKENOMICS_BY_NAME.values()),
+        overwrite=args.overwrite,
+        max_workers=args.max_workers,
+    )
 
-    query_name = "lagerst_owners"
-    for address, type in addresess_erc20_721.items():
 
-        if type == "NFT":
+def run_tokenomics_queries_handler(args: argparse.Namespace):
 
-            params = {
-                "address": address,
-            }
+    client = get_client()
 
-            generate_report(
-                client=client,
-                token=args.moonstream_token,
-                query_name=query_name,
-                params=params,
-                bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-                bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                key=f"{query_name}/{address}/data.json",
+    # Reports of one query run sequentially, see generate_query_reports
+    reports_by_query: Dict[str, List[Report]] = {
+        spec.query_name: [
+            (
+                spec.params(address, type, variant),
+                f"{spec.query_name}/{spec.key(address, type, variant)}/data.json",
             )
+            for address, type, variant in spec.iter()
+        ]
+        for spec in REPORTS
+    }
 
-    # total_supply_erc721
-
-    query_name = "total_supply_erc721"
-
-    for address, type in addresess_erc20_721.items():
-
-        if type == "NFT":
-
-            params = {
-                "address": address,
-            }
+    logger.info(
+        f"Generating {sum(len(reports) for reports in reports_by_query.values())} reports for {len(reports_by_query)} queries with {args.max_workers} workers"
+    )
 
-            generate_report(
+    if aiohttp is not None:
+        asyncio.run(
+            generate_reports_async(
                 client=client,
                 token=args.moonstream_token,
-                query_name=query_name,
-                params=params,
+                reports_by_query=reports_by_query,
                 bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
                 bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-                key=f"{query_name}/{address}/data.json",
+                max_workers=args.max_workers,
             )
-
-    # total_supply_terminus
-
-    query_name = "total_supply_terminus"
-
-    for address in addresess_erc1155:
-
-        params = {
-            "address": address,
-        }
-
-        generate_report(
-            client=client,
-            token=args.moonstream_token,
-            query_name=query_name,
-            params=params,
-            bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
-            bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
-            key=f"{query_name}/{address}/data.json",
         )
+    else:
+        logger.info("aiohttp is not installed, generating reports in threads")
+        with ThreadPoolExecutor(max_workers=args.max_workers) as executor:
+            futures: Dict[Future, str] = {
+                executor.submit(
+                    generate_query_reports,
+                    client=client,
+                    token=args.moonstream_token,
+                    query_name=query_name,
+                    reports=query_reports,
+                    bucket_prefix=MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX,
+                    bucket=MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
+                ): query_name
+                for query_name, query_reports in reports_by_query.items()
+            }
+
+            for future in as_completed(futures):
+                error = future.exception()
+                if error is not None:
+                    logger.error(
+                        f"Reports of query {futures[future]} failed with error: {error}"
+                    )
 
     logger.info("Done")
 
@@ -445,21 +832,21 @@ def list_user_queries_handler(args: argparse.Namespace):
     List the user's queries.
     """
 
-    client = Moonstream()
+    client = get_client()
 
     queries = client.list_queries(
         token=args.moonstream_token,
     )
 
     for query in queries.queries:
-        logger.info(query.name, query.id)
+        logger.info(f"{query.name} {query.id}")
 
 
 def delete_user_query_handler(args: argparse.Namespace):
     """
     Delete the user's queries.
     """
-    client = Moonstream()
+    client = get_client()
 
     delete_user_query(client=client, token=args.moonstream_token, query_name=args.name)
 
@@ -468,69 +855,134 @@ def create_user_query_handler(args: argparse.Namespace):
     """
     Create the user's queries.
     """
-    client = Moonstream()
-
-    for query in tokenomics_queries:
+    client = get_client()
 
-        if query["name"] == args.name:
+    query = TOKENOMICS_BY_NAME.get(args.name)
 
-            create_user_query(
-                client=client,
-                token=args.moonstream_token,
-                query_name=query["name"],
-                query=query["query"],
-            )
+    if query is not None:
+        create_user_query(
+            client=client,
+            token=args.moonstream_token,
+            query_name=query["name"],
+            query=query["query"],
+        )
 
 
-def generate_game_bank_report(args: argparse.Namespace):
+def generate_game_bank_query_report(
+    client: Moonstream,
+    token: Union[str, UUID],
+    query_name: str,
+    max_retries: int = 30,
+):
     """
-    han
-    Generate the game bank query.
+    Execute the game bank query and push its results to the public bucket.
     """
 
-    client = Moonstream()
-
-    for query in client.list_queries(
-        token=args.moonstream_token,
-    ).queries:
-
-        params = {}
+    params: Dict[str, Any] = {}
 
-        if (
-            query.name == "cu-bank-withdrawals-total"
-            or query.name == "cu-bank-withdrawals-events"
-        ):
-            blocktimestamp = int(time.time())
-            params = {"block_timestamp": blocktimestamp}
+    if (
+        query_name == "cu-bank-withdrawals-total"
+        or query_name == "cu-bank-withdrawals-events"
+    ):
+        blocktimestamp = int(time.time())
+        params = {"block_timestamp": blocktimestamp}
 
-        keep_going = True
+    repeat = 0
 
-        if_modified_since_datetime = datetime.datetime.utcnow()
-        if_modified_since = if_modified_since_datetime.strftime(
+    # If-Modified-Since has second precision, step back one second so that results
+    # written within the same second as the request are not reported as not modified.
+    if_modified_since_datetime = datetime.datetime.now(
+        datetime.timezone.utc
+    ) - datetime.timedelta(seconds=1)
+    headers = {
+        "If-Modified-Since": if_modified_since_datetime.strftime(
             "%a, %d %b %Y %H:%M:%S GMT"
         )
+    }
 
-        data_url = client.exec_query(
-            token=args.moonstream_token,
-            query_name=query.name,
-            params=params,
-        )  # S3 presign_url
-        while keep_going:
-            data_response = requests.get(
-                data_url,
-                headers={"If-Modified-Since": if_modified_since},
+    data_url = client.exec_query(
+        token=token,
+        name=query_name,
+        params=params,
+    )  # S3 presign_url
+    while True:
+        try:
+            data_response = s3_session.get(
+                data_url.url,
+                headers=headers,
                 timeout=10,
             )
+        except Exception as e:
+            logger.error(e)
+            repeat += 1
+            if repeat > max_retries:
+                raise
+            time.sleep(2)
+            continue
+
+        if data_response.status_code == 200:
             # push to s3
+            key = f"{MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX}/cu_bank/{query_name}/data.json"
+            client.upload_query_results(
+                data_response.content,
+                MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
+                key,
+            )
+            logger.info(
+                f"Report generated and results uploaded at: https://{MOONSTREAM_S3_PUBLIC_DATA_BUCKET}/{key}"
+            )
+            break
 
-            if data_response.status_code == 200:
-                json.dumps(data_response.json())
-                break
-            else:
-                time.sleep(2)
-                continue
+        repeat += 1
+
+        if repeat > max_retries:
+            raise Exception(
+                f"Too many retries for query: {query_name}, last status code: {data_response.status_code}"
+            )
+
+        time.sleep(2)
+
+
+def generate_game_bank_report(args: argparse.Namespace, max_retries: int = 30):
+    """
+    han
+    Generate the game bank query.
+    """
 
-    pass
+    client = get_client()
+
+    for query_name in CU_BANK_BY_NAME:
+        try:
+            generate_game_bank_query_report(
+                client=client,
+                token=args.moonstream_token,
+                query_name=query_name,
+                max_retries=max_retries,
+            )
+        except Exception as err:
+            logger.error(
+                f"Cant generate report for query: {query_name}. End with error: {err}"
+            )
+
+
+def start_logs_listener() -> QueueListener:
+    """
+    Route root logger records through a queue, so report workers do not block on
+    stream writes. Configured handlers are moved to a listener thread.
+    """
+
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers[:]
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+
+    logs_queue: "Queue[logging.LogRecord]" = Queue(-1)
+    root_logger.addHandler(QueueHandler(logs_queue))
+
+    listener = QueueListener(logs_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    return listener
 
 
 def main():
@@ -573,6 +1025,13 @@ def main():
 
     init_game_bank_parser.add_argument("--overwrite", type=bool, default=False)
 
+    init_game_bank_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="Number of queries created concurrently",
+    )
+
     init_game_bank_parser.set_defaults(func=init_game_bank_queries_handler)
 
     init_tokenonomics_parser = queries_subparsers.add_parser(
@@ -583,6 +1042,13 @@ def main():
 
     init_tokenonomics_parser.add_argument("--overwrite", type=bool, default=False)
 
+    init_tokenonomics_parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="Number of queries created concurrently",
+    )
+
     init_tokenonomics_parser.set_defaults(func=init_tokenomics_queries_handler)
 
     generate_report = queries_subparsers.add_parser(
@@ -591,6 +1057,13 @@ def main():
         description="Run tokenomics queries and push to S3 public backet",
     )
 
+    generate_report.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="Number of reports generated concurrently",
+    )
+
     generate_report.set_defaults(func=run_tokenomics_queries_handler)
 
     delete_query = queries_subparsers.add_parser(
@@ -628,7 +1101,12 @@ def main():
 
     cu_bank_parser.set_defaults(func=generate_game_bank_report)
     args = parser.parse_args()
-    args.func(args)
+
+    listener = start_logs_listener()
+    try:
+        args.func(args)
+    finally:
+        listener.stop()
 
 
 if __name__ == "__main__":
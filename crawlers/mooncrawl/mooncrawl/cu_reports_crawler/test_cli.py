@@ -0,0 +1,239 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from . import cli
+
+
+class TestPollDelay(unittest.TestCase):
+    def test_delay_doubles_up_to_cap(self):
+        with mock.patch.object(cli.random, "uniform", return_value=0):
+            delays = [cli.poll_delay(repeat, 0.2, 8.0) for repeat in range(9)]
+        self.assertEqual(delays, [0.2, 0.4, 0.8, 1.6, 3.2, 6.4, 8.0, 8.0, 8.0])
+
+    def test_jitter_is_at_most_tenth_of_delay(self):
+        for repeat in range(9):
+            delay = min(8.0, 0.2 * 2**repeat)
+            for _ in range(100):
+                jittered = cli.poll_delay(repeat, 0.2, 8.0)
+                self.assertGreaterEqual(jittered, delay)
+                self.assertLessEqual(jittered, 1.1 * delay)
+
+
+class TestQueryResultsPoll(unittest.TestCase):
+    def test_delay_is_clipped_to_max_wait(self):
+        poll = cli.QueryResultsPoll(query_name="query", max_wait=10, executed_at=100)
+        poll.repeat = 6
+        with mock.patch.object(cli.time, "time", return_value=107):
+            self.assertEqual(poll.delay(), 3)
+        with mock.patch.object(cli.time, "time", return_value=120):
+            self.assertEqual(poll.delay(), 0)
+
+
+class TestReciveS3DataFromQuery(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.Mock()
+        self.client.exec_query.return_value = mock.Mock(
+            url="https://bucket.s3.amazonaws.com/queries/1/data.json"
+        )
+
+    def recive(self, previous, statuses, etag='"abc"', **kwargs):
+        """
+        previous are statuses (or exceptions) of the reads of results before execution,
+        statuses of the polls after.
+        """
+
+        responses = [
+            (
+                mock.Mock(
+                    status_code=status,
+                    content=b"{}",
+                    headers={"ETag": etag} if etag is not None else {},
+                )
+                if isinstance(status, int)
+                else status
+            )
+            for status in previous + statuses
+        ]
+        with mock.patch.object(cli.s3_session, "get", side_effect=responses) as get:
+            try:
+                return cli.recive_S3_data_from_query(
+                    client=self.client,
+                    token="token",
+                    query_name="query",
+                    params={},
+                    results_url="https://bucket.s3.amazonaws.com/queries/1/data.json",
+                    backoff_base=0,
+                    **kwargs,
+                )
+            finally:
+                self.get_call_count = get.call_count
+                self.poll_headers = [
+                    call.kwargs["headers"]
+                    for call in get.call_args_list[len(previous) :]
+                ]
+
+    def test_first_results_are_returned(self):
+        data = self.recive([404], [404] * 3 + [200])
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.get_call_count, 5)
+        self.assertEqual(self.poll_headers, [{}] * 4)
+
+    def test_results_available_on_first_poll_are_returned(self):
+        data = self.recive([206], [200])
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.get_call_count, 2)
+        self.assertEqual(self.poll_headers, [{"If-None-Match": '"abc"'}])
+
+    def test_previous_results_are_not_returned(self):
+        with self.assertRaisesRegex(Exception, "not changed"):
+            self.recive([206], [304] * 10, max_retries=3)
+        self.assertEqual(self.get_call_count, 5)
+
+    def test_previous_results_without_etag_are_not_checked(self):
+        data = self.recive([206], [200], etag=None)
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.poll_headers, [{}])
+
+    def test_forbidden_previous_results_are_missing(self):
+        data = self.recive([403], [200])
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.get_call_count, 2)
+        self.assertEqual(self.poll_headers, [{}])
+
+    def test_failed_read_of_previous_results_is_retried(self):
+        data = self.recive([ConnectionError("reset"), 503, 206], [304, 200])
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.get_call_count, 5)
+        self.assertEqual(self.poll_headers, [{"If-None-Match": '"abc"'}] * 2)
+
+    def test_previous_results_are_not_checked_after_max_retries(self):
+        data = self.recive([ConnectionError("reset")] * 3, [200], max_retries=2)
+        self.assertEqual(data, b"{}")
+        self.assertEqual(self.get_call_count, 4)
+        self.assertEqual(self.poll_headers, [{}])
+        self.client.exec_query.assert_called_once()
+
+    def test_polling_stops_at_max_wait(self):
+        with self.assertRaisesRegex(Exception, "not changed"):
+            self.recive([206], [304] * 10, max_wait=0)
+        self.assertEqual(self.get_call_count, 2)
+
+
+class TestInitQueries(unittest.TestCase):
+    def test_failed_queries_are_logged(self):
+        client = mock.Mock()
+        client.create_query.side_effect = Exception("boom")
+        with self.assertLogs(cli.logger, level="ERROR") as logs:
+            cli.init_queries(
+                client=client,
+                token="token",
+                queries=[{"name": "query", "query": "SELECT 1"}],
+            )
+        self.assertIn("Cant create query: query", logs.output[0])
+
+
+class TestGenerateGameBankQueryReport(unittest.TestCase):
+    def test_not_modified_results_stop_after_max_retries(self):
+        client = mock.Mock()
+        with mock.patch.object(
+            cli.s3_session, "get", return_value=mock.Mock(status_code=304)
+        ) as get, mock.patch.object(cli.time, "sleep"):
+            with self.assertRaisesRegex(Exception, "last status code: 304"):
+                cli.generate_game_bank_query_report(
+                    client=client,
+                    token="token",
+                    query_name="cu-bank-blances",
+                    max_retries=3,
+                )
+        self.assertEqual(get.call_count, 4)
+        client.upload_query_results.assert_not_called()
+
+
+class TestGenerateGameBankReport(unittest.TestCase):
+    def test_results_of_each_query_are_uploaded_after_failures(self):
+        failed, *query_names = cli.CU_BANK_BY_NAME
+
+        def exec_query(token, name, params):
+            if name == failed:
+                raise Exception("boom")
+            return mock.Mock(url=f"https://bucket.s3.amazonaws.com/{name}")
+
+        def get(url, **kwargs):
+            return mock.Mock(status_code=200, content=url.encode())
+
+        client = mock.Mock()
+        client.exec_query.side_effect = exec_query
+        with mock.patch.object(cli, "get_client", return_value=client):
+            with mock.patch.object(cli.s3_session, "get", side_effect=get):
+                with self.assertLogs(cli.logger, level="ERROR") as logs:
+                    cli.generate_game_bank_report(mock.Mock(moonstream_token="token"))
+
+        self.assertEqual(
+            client.upload_query_results.call_args_list,
+            [
+                mock.call(
+                    f"https://bucket.s3.amazonaws.com/{name}".encode(),
+                    cli.MOONSTREAM_S3_PUBLIC_DATA_BUCKET,
+                    f"{cli.MOONSTREAM_S3_PUBLIC_DATA_BUCKET_PREFIX}/cu_bank/{name}/data.json",
+                )
+                for name in query_names
+            ],
+        )
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f"Cant generate report for query: {failed}", logs.output[0])
+
+
+class FakeResponse:
+    def __init__(self, status, etag):
+        self.status = status
+        self.headers = {"ETag": etag} if etag is not None else {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    async def read(self):
+        return b"{}"
+
+
+class FakeSession:
+    def __init__(self, statuses, etag):
+        self.statuses = iter(statuses)
+        self.etag = etag
+        self.headers = []
+
+    def get(self, url, headers, timeout):
+        self.headers.append(headers)
+        status = next(self.statuses)
+        if isinstance(status, Exception):
+            raise status
+        return FakeResponse(status, self.etag)
+
+
+@unittest.skipIf(cli.aiohttp is None, "aiohttp is not installed")
+class TestReciveS3DataFromQueryAsync(TestReciveS3DataFromQuery):
+    def recive(self, previous, statuses, etag='"abc"', **kwargs):
+        session = FakeSession(previous + statuses, etag)
+        try:
+            return asyncio.run(
+                cli.recive_S3_data_from_query_async(
+                    session=session,
+                    client=self.client,
+                    token="token",
+                    query_name="query",
+                    params={},
+                    results_url="https://bucket.s3.amazonaws.com/queries/1/data.json",
+                    backoff_base=0,
+                    **kwargs,
+                )
+            )
+        finally:
+            self.get_call_count = len(session.headers)
+            self.poll_headers = session.headers[len(previous) :]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -38,7 +38,7 @@ setup(
         "chardet",
         "fastapi",
         "moonstreamdb>=0.3.2",
-        "moonstream>=0.1.1",
+        "moonstream>=0.1.2",
         "moonworm[moonstream]>=0.5.2",
         "humbug",
         "pydantic==1.9.2",
@@ -49,8 +49,16 @@ setup(
         "web3[tester]",
     ],
     extras_require={
-        "dev": ["black", "isort", "mypy", "types-requests", "types-python-dateutil"],
+        "dev": [
+            "aiohttp",
+            "black",
+            "isort",
+            "mypy",
+            "types-requests",
+            "types-python-dateutil",
+        ],
         "distribute": ["setuptools", "twine", "wheel"],
+        "reports": ["aiohttp"],
     },
     entry_points={
         "console_scripts": [